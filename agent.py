@@ -1,9 +1,14 @@
 import lmstudio as lms
 from qdrant_client import QdrantClient, models
 from typing import List
+import numpy as np
 import json
+import argparse
 from datetime import datetime
 from pathlib import Path
+import sparse_vectors
+from embedding_dimension import check_embedding_dimension
+from query_cache import QueryEmbeddingCache, RetrievalCache
 
 class QuerySchema(lms.BaseModel):
     queries: List[str]
@@ -13,21 +18,251 @@ def generate_queries(input, model):
     queries = json.loads(response.content)["queries"]
     return queries
 
-def retrieve_articles(queries, client, embedding_model):
-    articles = []
-    seen_ids = set()
-    for q in queries:
-        query_vector = embedding_model.embed(q)
-        points = client.query_points(
-            collection_name="article-collection",
-            query = query_vector,
-            score_threshold = 0.1,
-        ).points
-
+class TimeWindowSchema(lms.BaseModel):
+    has_time_window: bool
+    start_timestamp: datetime
+    end_timestamp: datetime
+def extract_time_window(input, model):
+    extract_time_window_prompt = f"""Does the user's question only concern news published within a specific period of time? If so, resolve the exact ISO 8601 (i.e. "2024-01-11T12:42:05.955Z") start and end timestamps of that period.
+If the question is not limited to a period of time, set has_time_window to false.
+Today's date is {datetime.now().isoformat()}.
+User's input question: {input}
+"""
+    response = model.respond(extract_time_window_prompt, response_format=TimeWindowSchema)
+    time_window = json.loads(response.content)
+    if not time_window["has_time_window"]:
+        return None
+    return (time_window["start_timestamp"], time_window["end_timestamp"])
+
+def build_search_params(config):
+    # hnsw_ef trades latency for recall per query (Qdrant picks it when unset)
+    # quantized collections search the compressed vectors, then rescore an oversampled candidate set with the originals
+    quantization = None
+    if config.get("quantization") is not None:
+        quantization = models.QuantizationSearchParams(
+            rescore=config.get("quantization_rescore", True),
+            oversampling=config.get("quantization_oversampling", 2.0),
+        )
+    if quantization is None and config.get("hnsw_ef") is None:
+        return None
+    return models.SearchParams(hnsw_ef=config.get("hnsw_ef"), quantization=quantization)
+
+def blend_title_scores(body_points, title_points, title_weight):
+    # each point scored (1 - title_weight) * body + title_weight * title similarity
+    points = {}
+    scores = {}
+    for weight, hits in ((1 - title_weight, body_points), (title_weight, title_points)):
+        for point in hits:
+            points.setdefault(point.id, point)
+            scores[point.id] = scores.get(point.id, 0) + weight * point.score
+    for point_id, point in points.items():
+        point.score = scores[point_id]
+    return sorted(points.values(), key=lambda point: point.score, reverse=True)
+
+# payload fields needed to rank, group and filter articles, their content and events are fetched once they are candidates
+LIGHT_PAYLOAD_FIELDS = ["title", "subtitle", "published", "parent_id", "chunk_index", "cluster_id"]
+
+def fuse_results(results, fusion="rrf", rrf_k=60):
+    # results holds one score-sorted point list per query, an article is ranked within a query by its best passage
+    # "rrf" sums 1 / (rrf_k + rank) over the queries, "max" keeps the best similarity and "sum" adds each query's best similarity
+    if fusion not in ("rrf", "max", "sum"):
+        raise ValueError(f'Unknown fusion "{fusion}", expected "rrf", "max" or "sum"')
+    articles = {}
+    passages = {}
+    scores = {}
+    for points in results:
+        ranks = {}
         for point in points:
-            if point.id not in seen_ids:
-                seen_ids.add(point.id)
-                articles.append(point)
+            parent_id = point.payload.get("parent_id", point.id)
+            if parent_id not in articles or point.score > articles[parent_id].score:
+                articles[parent_id] = point # best scoring passage represents the article
+            passages.setdefault(parent_id, {})[point.payload.get("chunk_index", 0)] = point.id
+            if parent_id in ranks:
+                continue
+            ranks[parent_id] = len(ranks) + 1
+            if fusion == "rrf":
+                scores[parent_id] = scores.get(parent_id, 0) + 1 / (rrf_k + ranks[parent_id])
+            elif fusion == "max":
+                scores[parent_id] = max(scores.get(parent_id, point.score), point.score)
+            else:
+                scores[parent_id] = scores.get(parent_id, 0) + point.score
+    return articles, passages, scores
+
+def adaptive_cutoff(ranked, mode, min_articles=3):
+    # focused questions have a few strong matches and then a drop, broad ones decay slowly, so cut where the scores fall off
+    # "gap" cuts at the largest drop between neighbouring scores, "knee" where the score curve bends furthest from the line between its ends
+    if mode not in ("gap", "knee"):
+        raise ValueError(f'Unknown cutoff "{mode}", expected "gap", "knee" or null')
+    min_articles = max(min_articles, 1) # the top article is always kept, and both modes measure from it
+    if len(ranked) <= min_articles:
+        return ranked
+    scores = [article.score for article in ranked]
+    if scores[min_articles - 1] == scores[-1]: # flat past the minimum, nothing falls off
+        return ranked
+    if mode == "gap":
+        drops = [scores[i - 1] - scores[i] for i in range(min_articles, len(scores))]
+        return ranked[:min_articles + drops.index(max(drops))]
+    # distance of each inner point below the chord from the first to the last score, the endpoints lie on it
+    span = scores[0] - scores[-1]
+    last = len(scores) - 1
+    distances = {i: (scores[0] - scores[i]) / span - i / last for i in range(1, last)}
+    if not distances:
+        return ranked
+    below = max(distances, key=distances.get)
+    above = min(distances, key=distances.get)
+    if distances[below] > 1e-9: # scores drop early then flatten, the knee is the first point of the flat tail
+        cut = below
+    elif distances[above] < -1e-9: # every point is above the chord, scores hold then drop at the end, the knee is the last point before the drop
+        cut = above + 1
+    else: # scores fall evenly, there is no knee to cut at
+        return ranked
+    return ranked[:max(cut, min_articles)]
+
+def dense_vector(point, vector_name=None):
+    # named vectors come back as a dict, the unnamed dense vector is stored under ""
+    # points written by --headlines-only have no body vector yet, so their title vector (same model and space) stands in
+    if not isinstance(point.vector, dict):
+        return point.vector
+    return point.vector.get(vector_name or "", point.vector.get("title"))
+
+def mmr_rerank(ranked, vectors, mmr_lambda=0.7, k=None):
+    # greedily pick the article maximizing mmr_lambda * relevance - (1 - mmr_lambda) * similarity to those already picked,
+    # so copies of one story pulled in by several queries don't crowd out other coverage
+    if len(ranked) < 2:
+        return ranked
+    k = min(k or len(ranked), len(ranked))
+    embeddings = np.array(vectors, dtype=np.float32)
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    similarity = embeddings @ embeddings.T
+    scores = np.array([article.score for article in ranked], dtype=np.float32)
+    relevance = scores / scores.max() if scores.max() > 0 else scores # fused scores are on different scales per fusion mode
+
+    selected = [0]
+    redundancy = similarity[0].copy()
+    available = np.ones(len(ranked), dtype=bool)
+    available[0] = False
+    while len(selected) < k:
+        mmr = np.where(available, mmr_lambda * relevance - (1 - mmr_lambda) * redundancy, -np.inf)
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return [ranked[i] for i in selected]
+
+def collection_version(client, collection_name):
+    # an alias swap or a changed point count marks the collection as updated, in-place payload edits only expire with the TTL
+    aliases = {description.alias_name: description.collection_name for description in client.get_aliases().aliases}
+    target = aliases.get(collection_name, collection_name)
+    return target, client.get_collection(target).points_count
+
+def search_filter(time_window=None, embedding_model_name=None):
+    # time_window is an optional (start, end) pair of ISO 8601 timestamps, matched against the indexed published date
+    # embedding_model_name skips points embedded by any other model, whose scores against our query vectors are meaningless
+    must = []
+    must_not = []
+    if time_window is not None:
+        must.append(models.FieldCondition(key="published", range=models.DatetimeRange(gte=time_window[0], lte=time_window[1])))
+    if embedding_model_name is not None:
+        must_not.append(models.FieldCondition(key="embedding_model", match=models.MatchExcept(**{"except": [embedding_model_name]})))
+    return models.Filter(must=must, must_not=must_not) if must or must_not else None
+
+def embed_queries(queries, embedding_model, embedding_model_name=None, embedding_cache=None):
+    # all queries in one embed() call, minus the ones the QueryEmbeddingCache already holds
+    if embedding_cache is not None:
+        return embedding_cache.embed(embedding_model, embedding_model_name, queries)
+    return embedding_model.embed(queries)
+
+def build_query_requests(queries, query_vectors, query_filter, search_params=None, top_k=10, score_threshold=0.1, hybrid=False, title_fusion=None, with_vectors=False):
+    # hybrid runs the dense and the BM25-style sparse search server-side and fuses them with reciprocal rank fusion
+    # title_fusion is None for collections without title vectors, "rrf" to fuse body and title searches server-side,
+    # or "weighted" for a body and a title request per query, blended by blend_title_scores (with hybrid on, everything is fused by RRF)
+    dense_vector_name = "body" if title_fusion else None
+    requests = []
+    for q, query_vector in zip(queries, query_vectors):
+        if title_fusion == "weighted" and not hybrid:
+            for vector_name in ("body", "title"):
+                requests.append(models.QueryRequest(query=query_vector, using=vector_name, filter=query_filter, params=search_params, limit=top_k, score_threshold=score_threshold, with_payload=LIGHT_PAYLOAD_FIELDS, with_vectors=with_vectors))
+        elif hybrid or title_fusion:
+            prefetch = [models.Prefetch(query=query_vector, using=dense_vector_name, filter=query_filter, params=search_params, limit=top_k, score_threshold=score_threshold)]
+            if title_fusion:
+                prefetch.append(models.Prefetch(query=query_vector, using="title", filter=query_filter, params=search_params, limit=top_k, score_threshold=score_threshold))
+            if hybrid:
+                prefetch.append(models.Prefetch(query=sparse_vectors.query_vector(q), using=sparse_vectors.SPARSE_VECTOR_NAME, filter=query_filter, limit=top_k))
+            requests.append(models.QueryRequest(prefetch=prefetch, query=models.FusionQuery(fusion=models.Fusion.RRF), limit=top_k, with_payload=LIGHT_PAYLOAD_FIELDS, with_vectors=with_vectors))
+        else:
+            requests.append(models.QueryRequest(query=query_vector, using=dense_vector_name, filter=query_filter, params=search_params, limit=top_k, score_threshold=score_threshold, with_payload=LIGHT_PAYLOAD_FIELDS, with_vectors=with_vectors))
+    return requests
+
+def run_queries(client, collection_name, requests, result_cache=None):
+    # one query_batch_points call for every request the RetrievalCache can't answer, returning a point list per request
+    responses = [None] * len(requests)
+    if result_cache is not None:
+        result_cache.check_version(collection_version(client, collection_name))
+        keys = [result_cache.key(collection_name, request) for request in requests]
+        responses = [result_cache.get(key) for key in keys]
+    missing = [i for i, points in enumerate(responses) if points is None]
+    if missing:
+        for i, response in zip(missing, client.query_batch_points(collection_name=collection_name, requests=[requests[i] for i in missing])):
+            responses[i] = response.points
+            if result_cache is not None:
+                result_cache.put(keys[i], response.points)
+    return responses
+
+def rank_articles(results, fusion="rrf", rrf_k=60):
+    # passage hits are grouped under their parent article, which keeps the ids of the passages that matched for fetch_content
+    articles, passages, scores = fuse_results(results, fusion, rrf_k)
+    for parent_id, article in articles.items():
+        article.id = parent_id
+        article.score = scores[parent_id]
+        article.payload["passage_ids"] = [passages[parent_id][i] for i in sorted(passages[parent_id])]
+    return sorted(articles.values(), key=lambda article: article.score, reverse=True)
+
+def collapse_clusters(ranked):
+    # keep the best ranked representative per near-duplicate cluster
+    clusters = {}
+    for article in ranked:
+        clusters.setdefault(article.payload.get("cluster_id", article.id), article)
+    return list(clusters.values())
+
+def retrieve_articles(queries, client, embedding_model, *,
+                      collection_name="article-collection", embedding_model_name=None, time_window=None,
+                      search_params=None, top_k=10, score_threshold=0.1, hybrid=False, title_fusion=None, title_weight=0.3,
+                      fusion="rrf", rrf_k=60, collapse_duplicates=False, cutoff=None, min_articles=3, mmr_lambda=None,
+                      candidate_budget=None, embedding_cache=None, result_cache=None):
+    # articles ranked by their evidence fused across all queries, carrying only LIGHT_PAYLOAD_FIELDS until fetch_content
+    # cutoff ("gap" or "knee") trims the ranking where its scores fall off, mmr_lambda reorders it for diversity before the candidate_budget cut
+    if not queries:
+        return []
+    query_vectors = embed_queries(queries, embedding_model, embedding_model_name, embedding_cache)
+    with_vectors = (["body", "title"] if title_fusion else True) if mmr_lambda is not None else False
+    requests = build_query_requests(queries, query_vectors, search_filter(time_window, embedding_model_name), search_params, top_k, score_threshold, hybrid, title_fusion, with_vectors)
+    results = run_queries(client, collection_name, requests, result_cache)
+    if title_fusion == "weighted" and not hybrid:
+        results = [blend_title_scores(body, title, title_weight) for body, title in zip(results[::2], results[1::2])]
+
+    ranked = rank_articles(results, fusion, rrf_k)
+    if collapse_duplicates:
+        ranked = collapse_clusters(ranked)
+    if cutoff is not None:
+        ranked = adaptive_cutoff(ranked, cutoff, min_articles)
+    if mmr_lambda is not None:
+        ranked = mmr_rerank(ranked, [dense_vector(article, "body" if title_fusion else None) for article in ranked], mmr_lambda, candidate_budget)
+    return ranked[:candidate_budget] if candidate_budget else ranked
+
+def fetch_content(articles, client, collection_name, batch_size=256):
+    # joins the content of each article's matched passages, and their events when all of them were enriched at ingest
+    ids = [point_id for article in articles if "content" not in article.payload for point_id in article.payload["passage_ids"]]
+    passages = {}
+    for i in range(0, len(ids), batch_size):
+        for point in client.retrieve(collection_name=collection_name, ids=ids[i:i + batch_size], with_payload=["content", "events"]):
+            passages[point.id] = point.payload
+    for article in articles:
+        if "content" in article.payload:
+            continue
+        matched = [passages[point_id] for point_id in article.payload["passage_ids"] if point_id in passages] # skips points deleted since the search
+        article.payload["content"] = "\n[...]\n".join(payload["content"] for payload in matched)
+        if matched and all("events" in payload for payload in matched): # events precomputed at ingest for every matched passage
+            article.payload["events"] = [event for payload in matched for event in payload["events"]]
     return articles
 
 class RelevanceSchema(lms.BaseModel):
@@ -51,17 +286,17 @@ class Event(lms.BaseModel):
     description: str
 class EventSchema(lms.BaseModel):
     events: List[Event]
-def extract_events(relevant_articles, model):
+def extract_events(relevant_articles, model, input=None):
     #all relevant articles get events extracted from them
+    #without an input (ingest-time enrichment) every notable event is kept, regardless of any question
+    focus = f"\nFocus on events that could be related to the user's input: {input}\n" if input is not None else ""
     articles_events = []
     for article in relevant_articles:
         extract_events_prompt = f"""Extract all notable events from this news article.
 For each event, provide:
 - entity: The main person, company, organization, or thing involved
 - description: A concise description of what happened, and when it happened
-
-Focus on events that could be related to the user's input: {input}
-
+{focus}
 Article Title: {article.payload["title"]}
 Subtitle: {article.payload["subtitle"]}
 Content: {article.payload["content"]}
@@ -121,6 +356,31 @@ Event: {event["description"]}
     
     return timestamped_articles_events
 
+class EventSelectionSchema(lms.BaseModel):
+    relevant_events: List[int]
+def select_events(relevant_articles, input, model):
+    #articles enriched at ingest time already carry timestamped events, only the ones related to the input are kept
+    timestamped_articles_events = []
+    for article in relevant_articles:
+        events = article.payload["events"]
+        if not events:
+            continue
+        event_list = chr(10).join(f"{i}. {event['entity']}: {event['description']}" for i, event in enumerate(events))
+        select_events_prompt = f"""Which of these events extracted from a news article could be related to the user's input? Respond with the list of their numbers.
+User's input: {input}
+
+Article Title: {article.payload["title"]}
+Events:
+{event_list}
+"""
+        response = model.respond(select_events_prompt, response_format=EventSelectionSchema)
+        selected = json.loads(response.content)["relevant_events"]
+        timestamped_articles_events.append({
+            "article": article,
+            "events": [events[i] for i in selected if 0 <= i < len(events)]
+        })
+    return timestamped_articles_events
+
 def construct_timeline(timestamped_articles_events):
     timeline = []
     
@@ -196,25 +456,73 @@ Total Events Analyzed: {len(timeline)}
     
 if __name__ == "__main__":
     config = json.load(open("config.json", 'r'))
+
+    parser = argparse.ArgumentParser(description="Answer the configured input from the indexed articles")
+    parser.add_argument("--collection", default=config["qdrant_collection_name"], help="collection or alias to search")
+    parser.add_argument("--top-k", type=int, default=config.get("retrieval_top_k", 10), help="points returned per query")
+    parser.add_argument("--score-threshold", type=float, default=config.get("retrieval_score_threshold", 0.1), help="minimum dense similarity")
+    parser.add_argument("--cutoff", choices=["gap", "knee"], default=config.get("retrieval_cutoff"), help="trim the ranked articles where their scores fall off")
+    args = parser.parse_args()
+
     input = config["input"]
     client = QdrantClient(url=config["qdrant_client_url"])
     model = lms.llm(config["lmstudio_llm"])
     embedding_model = lms.embedding_model(config["lmstudio_embedding"])
 
+    check_embedding_dimension(client, args.collection, embedding_model, config["lmstudio_embedding"])
+
     print("GENERATING QUERIES")
     queries = generate_queries(input, model)
 
+    # time_window is null, "auto" to derive it from the input, or {"start": ..., "end": ...}
+    time_window = config.get("time_window")
+    if time_window == "auto":
+        print("RESOLVING TIME WINDOW")
+        time_window = extract_time_window(input, model)
+    elif time_window is not None:
+        time_window = (time_window["start"], time_window["end"])
+
     print("RETRIEVING ARTICLES")
-    articles = retrieve_articles(queries, client, embedding_model)
+    embedding_cache = QueryEmbeddingCache(config.get("query_cache_size", 1024))
+    result_cache = RetrievalCache(config.get("retrieval_cache_size", 256), config.get("retrieval_cache_ttl", 300))
+    articles = retrieve_articles(
+        queries, client, embedding_model,
+        collection_name=args.collection,
+        embedding_model_name=config["lmstudio_embedding"],
+        time_window=time_window,
+        search_params=build_search_params(config),
+        top_k=args.top_k,
+        score_threshold=args.score_threshold,
+        hybrid=config.get("sparse_vectors", False),
+        title_fusion=config.get("title_fusion", "rrf") if config.get("title_vectors", False) else None,
+        title_weight=config.get("title_weight", 0.3),
+        fusion=config.get("fusion", "rrf"),
+        rrf_k=config.get("rrf_k", 60),
+        collapse_duplicates=config.get("collapse_duplicates", False),
+        cutoff=args.cutoff,
+        min_articles=config.get("retrieval_min_articles", 3),
+        mmr_lambda=config.get("mmr_lambda"),
+        candidate_budget=config.get("candidate_budget"),
+        embedding_cache=embedding_cache,
+        result_cache=result_cache,
+    )
+    print(f"Query embedding cache: {embedding_cache.stats()}, retrieval cache: {result_cache.stats()}")
+
+    print("FETCHING ARTICLE CONTENT")
+    fetch_content(articles, client, args.collection)
 
     print("FILTERING IRRELEVANT ARTICLES")
     relevant_articles = filter_articles(articles, input, model)
 
+    print("SELECTING PRECOMPUTED EVENTS")
+    timestamped_articles_events = select_events([article for article in relevant_articles if "events" in article.payload], input, model)
+    relevant_articles = [article for article in relevant_articles if "events" not in article.payload]
+
     print("EXTRACTING EVENTS")
-    articles_events = extract_events(relevant_articles, model)
+    articles_events = extract_events(relevant_articles, model, input)
 
     print("RESOLVING TIMESTAMPS")
-    timestamped_articles_events = resolve_timestamps(articles_events, model)
+    timestamped_articles_events += resolve_timestamps(articles_events, model)
 
     print("CONSTRUCTING TIMELINE")
     timeline = construct_timeline(timestamped_articles_events)
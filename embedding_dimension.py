@@ -0,0 +1,12 @@
+# shared by agent.py and the scripts so the query side and the ingest side check collections the same way
+
+def embedding_dimension(embedding_model):
+    return len(embedding_model.embed("dimension probe"))
+
+def check_embedding_dimension(client, collection_name, embedding_model, embedding_model_name):
+    # vectors from a model with a different dimension can't be stored in or searched against the collection
+    vectors = client.get_collection(collection_name).config.params.vectors
+    size = vectors["body"].size if isinstance(vectors, dict) else vectors.size # named when title vectors are stored
+    dimension = embedding_dimension(embedding_model)
+    if size != dimension:
+        raise ValueError(f'Collection "{collection_name}" holds {size}-dimensional vectors but {embedding_model_name} produces {dimension}-dimensional ones, reindex into a new collection or switch lmstudio_embedding back')
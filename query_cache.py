@@ -0,0 +1,100 @@
+from collections import OrderedDict
+import threading
+import hashlib
+import copy
+import time
+
+# in-process caches for agent.py: repeated questions skip the embedding server and, within the TTL, Qdrant
+
+def normalize_query(text):
+    # whitespace only, case is kept since it matters for names and tickers
+    return " ".join(text.split())
+
+class LRUCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+class QueryEmbeddingCache(LRUCache):
+    # query vectors keyed by (embedding model, normalized query text)
+    def __init__(self, max_entries=1024):
+        super().__init__(max_entries)
+
+    def embed(self, embedding_model, model_name, queries):
+        # the normalized text is only the key, the first query seen for it is embedded as written
+        keys = [normalize_query(q) for q in queries]
+        vectors = [self.get((model_name, key)) for key in keys]
+        missing = {}
+        for key, q, vector in zip(keys, queries, vectors):
+            if vector is None:
+                missing.setdefault(key, q)
+        if missing:
+            embedded = dict(zip(missing, embedding_model.embed(list(missing.values()))))
+            for key, vector in embedded.items():
+                self.put((model_name, key), vector)
+            vectors = [embedded[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+        return vectors
+
+class RetrievalCache(LRUCache):
+    # scored points per Qdrant query request (vector, filter, limit and search params), expiring after ttl seconds
+    # and dropped entirely when the collection's version changes
+    def __init__(self, max_entries=256, ttl=300):
+        super().__init__(max_entries)
+        self.ttl = ttl
+        self.version = None
+        self.invalidations = 0
+
+    def key(self, collection_name, request):
+        return collection_name, hashlib.sha256(request.model_dump_json().encode('utf-8')).hexdigest()
+
+    def check_version(self, version):
+        if version != self.version:
+            if self.version is not None:
+                self.invalidations += 1
+            self.clear()
+            self.version = version
+
+    def get(self, key):
+        entry = super().get(key)
+        if entry is None:
+            return None
+        stored_at, points = entry
+        if time.monotonic() - stored_at > self.ttl:
+            with self.lock:
+                self.hits -= 1
+                self.misses += 1
+                self.entries.pop(key, None)
+            return None
+        return copy.deepcopy(points) # retrieve_articles rewrites ids, scores and payloads of the points it returns
+
+    def put(self, key, points):
+        super().put(key, (time.monotonic(), copy.deepcopy(points)))
+
+    def stats(self):
+        return {**super().stats(), "invalidations": self.invalidations}
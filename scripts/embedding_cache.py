@@ -0,0 +1,78 @@
+import sqlite3
+import threading
+import hashlib
+import time
+from array import array
+import argparse
+import json
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    # float32 vectors on disk keyed by (embedding model, sha256 of the embedded text)
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False) # shared by every ingest process, so wait out their write locks
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS embeddings (model TEXT, hash TEXT, vector BLOB, last_used INTEGER, PRIMARY KEY (model, hash))")
+
+    def get_many(self, model, hashes):
+        found = {}
+        with self.lock:
+            for i in range(0, len(hashes), 500): # stay under sqlite's bound parameter limit
+                chunk = hashes[i:i + 500]
+                rows = self.db.execute(f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(chunk))})", [model, *chunk])
+                for h, blob in rows:
+                    found[h] = array('f', blob).tolist()
+            if found:
+                self.db.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?", [(int(time.time()), model, h) for h in found])
+                self.db.commit()
+        return found
+
+    def put_many(self, model, items):
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", [(model, h, array('f', vector).tobytes(), int(time.time())) for h, vector in items])
+            self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            rows = self.db.execute("SELECT model, COUNT(*), SUM(LENGTH(vector)) FROM embeddings GROUP BY model").fetchall()
+            page_count, = self.db.execute("PRAGMA page_count").fetchone()
+            page_size, = self.db.execute("PRAGMA page_size").fetchone()
+        return rows, page_count * page_size
+
+    def evict(self, max_entries=None, keep_model=None):
+        # drop vectors from other models, then the least recently used beyond max_entries
+        with self.lock:
+            removed = 0
+            if keep_model is not None:
+                removed += self.db.execute("DELETE FROM embeddings WHERE model != ?", [keep_model]).rowcount
+            if max_entries is not None:
+                removed += self.db.execute("DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)", [max_entries]).rowcount
+            self.db.commit()
+        return removed
+
+    def compact(self):
+        with self.lock:
+            self.db.execute("VACUUM")
+
+if __name__ == "__main__":
+    config = json.load(open("config.json", 'r'))
+
+    parser = argparse.ArgumentParser(description="Inspect and maintain the on-disk embedding cache")
+    parser.add_argument("command", choices=["stats", "evict", "compact"])
+    parser.add_argument("--max-entries", type=int, help="evict: keep only the N most recently used vectors")
+    parser.add_argument("--other-models", action="store_true", help="evict: drop vectors not produced by lmstudio_embedding")
+    args = parser.parse_args()
+
+    cache = EmbeddingCache(config.get("embedding_cache_path", "embedding_cache.sqlite"))
+    if args.command == "evict":
+        removed = cache.evict(args.max_entries, config["lmstudio_embedding"] if args.other_models else None)
+        print(f"Evicted {removed} vectors")
+    elif args.command == "compact":
+        cache.compact()
+    rows, size = cache.stats()
+    for model, count, vector_bytes in rows:
+        print(f"{model}: {count} vectors, {vector_bytes / 2**20:.1f} MiB")
+    print(f"Cache file: {size / 2**20:.1f} MiB")
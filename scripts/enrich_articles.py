@@ -0,0 +1,41 @@
+from qdrant_client import QdrantClient, models
+import lmstudio as lms
+import json
+import argparse
+import sys
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(str(Path(__file__).resolve().parent.parent)) # the extraction prompts are shared with agent.py
+from agent import extract_events, resolve_timestamps
+
+config = json.load(open("config.json", 'r'))
+
+def point_events(point, model):
+    # the same query-independent extraction and timestamp resolution agent.py would run, done once per point
+    return resolve_timestamps(extract_events([point], model), model)[0]["events"]
+
+def enrich_articles(client, model, collection_name, workers, page_size):
+    # every point without events_model hasn't been enriched yet; the indexer's upserts replace the whole payload,
+    # so modified articles lose their events and are picked up again by the next run
+    pending = models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key="events_model"))])
+    enriched = 0
+    offset = None
+    with ThreadPoolExecutor(workers) as executor:
+        while True:
+            points, offset = client.scroll(collection_name=collection_name, scroll_filter=pending, limit=page_size, offset=offset, with_payload=["title", "subtitle", "content", "published"], with_vectors=False)
+            for point, events in zip(points, executor.map(lambda point: point_events(point, model), points)):
+                client.set_payload(collection_name=collection_name, payload={"events": events, "events_model": config["lmstudio_llm"]}, points=[point.id], wait=False)
+            enriched += len(points)
+            print(f"Enriched {enriched} points")
+            if offset is None:
+                return enriched
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract and timestamp article events with the LLM once, storing them in the point payloads")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent LLM requests")
+    parser.add_argument("--page-size", type=int, default=64, help="points per scroll page")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=config["qdrant_client_url"])
+    model = lms.llm(config["lmstudio_llm"])
+    enrich_articles(client, model, config["qdrant_collection_name"], args.workers, args.page_size)
@@ -4,44 +4,451 @@ import hashlib
 from pathlib import Path
 import lmstudio as lms
 import json
+import threading
+import queue
+import re
+import os
+import argparse
+from datetime import datetime, timezone
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import sys
+sys.path.append(str(Path(__file__).resolve().parent.parent)) # sparse_vectors.py and embedding_dimension.py are shared with agent.py
+from sparse_vectors import SPARSE_VECTOR_NAME, document_vector
+from embedding_cache import EmbeddingCache, text_hash
+from near_duplicates import NearDuplicateIndex
+from embedding_dimension import check_embedding_dimension
+from setup_qdrant import begin_bulk_load, end_bulk_load
 
 config = json.load(open("config.json", 'r'))
 
-client = QdrantClient(url=config["qdrant_client_url"])
+folder = Path(config["articles_path"])
 
-embedding_model = lms.embedding_model(config["lmstudio_embedding"])
+embedding_batch_size = config.get("embedding_batch_size", 32) # documents per embed() call
+upsert_batch_size = config.get("upsert_batch_size", 256) # points per upsert() call
+scroll_batch_size = config.get("scroll_batch_size", 10000) # points per scroll() page
+manifest_path = Path(config.get("manifest_path", "index_manifest.jsonl"))
+checkpoint_path = Path(config.get("checkpoint_path", "index_checkpoint.jsonl"))
+parse_workers = config.get("parse_workers", 2) # threads reading, hashing and parsing files
+embed_workers = config.get("embed_workers", 2) # threads with an embed() call in flight
+upsert_workers = config.get("upsert_workers", 2) # threads with an upsert() call in flight
+queue_size = config.get("queue_size", 1024) # max items buffered between stages, bounds memory
+chunk_max_chars = config.get("chunk_max_chars", 0) # split content into passages of at most this many characters, 0 embeds whole articles
+chunk_overlap_sentences = config.get("chunk_overlap_sentences", 1) # sentences repeated at the start of the next passage
+title_vectors = config.get("title_vectors", False) # store separate "title" (title + subtitle) and "body" dense vectors
+sparse_vectors = config.get("sparse_vectors", False) # also store a BM25-style lexical vector per point for hybrid retrieval
+sparse_avg_doc_length = config.get("sparse_avg_doc_length", 300) # words, BM25 length normalization
+embedding_cache = EmbeddingCache(config["embedding_cache_path"]) if config.get("embedding_cache_path") else None
+near_duplicates = NearDuplicateIndex(config["near_duplicate_index_path"], config.get("near_duplicate_bands", 16), config.get("near_duplicate_rows", 4), config.get("near_duplicate_threshold", 0.8)) if config.get("near_duplicate_index_path") else None
 
-folder = Path(config["articles_path"])
-txts = list(folder.glob("*.txt"))
+STOP = object() # end of stream marker, one per worker
+manifest_lock = threading.Lock()
+
+def normalize_timestamp(published):
+    # RFC 3339 in UTC so Qdrant's datetime index can range-filter it, unparseable values are kept as written
+    try:
+        timestamp = datetime.fromisoformat(published)
+    except ValueError:
+        return published
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
 
-def parse(txt):
-    lines = open(txt, 'r', encoding='utf-8').readlines()
+def parse(lines):
     payload = {
         "title": lines[0][6:].strip(),
         "subtitle": lines[1][9:].strip(),
-        "authors": lines[2][8:].strip(),
-        "published": lines[3][10:].strip(),
+        "authors": [author.strip() for author in lines[2][8:].split(",") if author.strip()],
+        "published": normalize_timestamp(lines[3][10:].strip()),
         "content": ''.join(lines[5:])
     }
     return payload
 
-for txt in txts:
+def article_id(txt):
+    return str(uuid.UUID(hashlib.md5(txt.relative_to(folder).as_posix().encode('utf-8')).hexdigest())) # use article path within the articles folder (its name in a flat folder) for deterministic UUID
+
+def in_partition(txt_id, partition):
+    index, count = partition
+    return uuid.UUID(txt_id).int % count == index
+
+def scan_articles(roots, partition=None):
+    # lazy os.scandir walk of every .txt file below roots, optionally only the ones whose ID hashes into partition (index, count)
+    stack = list(roots)
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".txt") and entry.is_file():
+                    txt = Path(entry.path)
+                    if partition is None or in_partition(article_id(txt), partition):
+                        yield txt
+
+def chunk_id(txt_id, chunk_index):
+    return str(uuid.UUID(hashlib.md5(f"{txt_id}:{chunk_index}".encode('utf-8')).hexdigest()))
+
+def chunk_text(content):
+    # sentence-bounded passages of at most chunk_max_chars, each starting with the last sentences of the previous one
+    sentences = [s for s in re.split(r'(?<=[.!?])\s+|\n\s*\n', content) if s.strip()]
+    chunks = []
+    current = []
+    for sentence in sentences:
+        if current and len(' '.join(current + [sentence])) > chunk_max_chars:
+            chunks.append(' '.join(current))
+            current = current[-chunk_overlap_sentences:] if chunk_overlap_sentences else []
+            if current and len(' '.join(current + [sentence])) > chunk_max_chars:
+                current = []
+        current.append(sentence)
+    if current or not chunks:
+        chunks.append(' '.join(current))
+    return chunks
+
+def article_passages(txt_id, payload):
+    # (point id, payload, text to embed) for every point an article is stored as
+    if not chunk_max_chars:
+        return [(txt_id, payload, f'{payload["title"]}\n\n{payload["subtitle"]}\n\n{payload["content"]}')]
+    chunks = chunk_text(payload["content"])
+    return [(chunk_id(txt_id, i), {**payload, "content": chunk, "parent_id": txt_id, "chunk_index": i, "chunk_count": len(chunks)}, f'{payload["title"]}\n\n{payload["subtitle"]}\n\n{chunk}') for i, chunk in enumerate(chunks)]
+
+def existing_ids(client, collection_name, partition=None):
+    # one paged scroll over the collection instead of a retrieve() per file, keeping each point's content hash
+    # points embedded by another model or still waiting for their body vector get no hash, so their articles are re-embedded like modified ones
+    ids = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=collection_name, limit=scroll_batch_size, offset=offset, with_payload=["content_hash", "parent_id", "embedding_model", "body_indexed"], with_vectors=False)
+        for point in points:
+            txt_id = point.payload.get("parent_id", str(point.id))
+            if partition is None or in_partition(txt_id, partition):
+                content_hash = point.payload.get("content_hash") if point.payload.get("embedding_model", config["lmstudio_embedding"]) == config["lmstudio_embedding"] and point.payload.get("body_indexed", True) else None
+                ids[txt_id] = content_hash if ids.get(txt_id, content_hash) == content_hash else None # every point of an article must agree
+        if offset is None:
+            return ids
+
+def partition_path(path, partition):
+    # each partition appends to its own manifest and checkpoint so processes and hosts never share a file
+    if partition is None or partition[1] == 1:
+        return path
+    return path.with_name(f"{path.stem}.{partition[0]}-of-{partition[1]}{path.suffix}")
+
+def load_manifest(partition=None):
+    # append-only logs of {"id", "mtime", "size", "content_hash"} per indexed file, last entry wins
+    # every partition's log is read, so progress survives a change in how the work is split
+    manifest = {}
+    for path in sorted(manifest_path.parent.glob(f"{manifest_path.stem}*{manifest_path.suffix}")):
+        for line in open(path, 'r', encoding='utf-8'):
+            entry = json.loads(line)
+            if partition is None or in_partition(entry["id"], partition):
+                manifest[entry["id"]] = entry
+    return manifest
+
+def append_manifest(entries, path):
+    with manifest_lock, open(path, 'a', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+def checkpoint_files(collection_name):
+    # (path, (index, count)) of every partition's checkpoint for runs into collection_name, whatever split wrote it
+    name = re.compile(re.escape(f"{checkpoint_path.stem}.{collection_name}") + r"(?:\.(\d+)-of-(\d+))?" + re.escape(checkpoint_path.suffix))
+    for path in sorted(checkpoint_path.parent.glob(f"{checkpoint_path.stem}.*{checkpoint_path.suffix}")):
+        match = name.fullmatch(path.name)
+        if match:
+            yield path, (int(match[1]), int(match[2])) if match[1] else (0, 1)
+
+class Checkpoint:
+    # append-only log of committed upsert batches for the current run, removed once the run completes
+    # each line holds the batch's article IDs with the mtime and size they were read at, so a run that dies is resumed
+    # without re-reading, re-embedding or re-upserting them, while files edited since are indexed again
+    # every split's checkpoints are read, so a resume with different --workers or --partition still finds its progress
+    def __init__(self, collection_name, partition=None):
+        self.partition = partition or (0, 1)
+        self.path = partition_path(checkpoint_path.with_name(f"{checkpoint_path.stem}.{collection_name}{checkpoint_path.suffix}"), partition) # a run only resumes into the collection it was writing
+        self.collection_name = collection_name
+        self.lock = threading.Lock()
+        self.committed = {}
+        self.batch = 0
+        for path, _ in checkpoint_files(collection_name):
+            for line in open(path, 'r', encoding='utf-8'):
+                entry = json.loads(line)
+                for txt_id, mtime, size in entry.get("articles", []):
+                    if in_partition(txt_id, self.partition):
+                        self.committed[txt_id] = (mtime, size)
+                if path == self.path:
+                    self.batch = entry["batch"] + 1
+
+    def unchanged(self, txt_id, stat):
+        return self.committed.get(txt_id) == (stat.st_mtime, stat.st_size)
+
+    def commit(self, articles):
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"batch": self.batch, "articles": articles}) + "\n")
+            self.batch += 1
+
+    def finish(self):
+        # this run covered every ID of its partition, so checkpoints of splits nested inside it are done too
+        # ones that also hold other partitions' IDs are kept for them, their entries are only trusted while the files are unmodified
+        index, count = self.partition
+        for path, (file_index, file_count) in checkpoint_files(self.collection_name):
+            if file_count % count == 0 and file_index % count == index:
+                path.unlink(missing_ok=True)
+
+def embed_texts(texts, embedding_model):
+    # one embed() call for every text the cache doesn't already hold
+    if embedding_cache is None:
+        return embedding_model.embed(texts)
+    hashes = [text_hash(text) for text in texts]
+    vectors = embedding_cache.get_many(config["lmstudio_embedding"], hashes)
+    missing = {h: text for h, text in zip(hashes, texts) if h not in vectors} # passages of one article share a title, embed it once
+    if missing:
+        embedded = list(zip(missing, embedding_model.embed(list(missing.values()))))
+        embedding_cache.put_many(config["lmstudio_embedding"], embedded)
+        vectors.update(embedded)
+    return [vectors[h] for h in hashes]
+
+def title_text(payload):
+    return f'{payload["title"]}\n\n{payload["subtitle"]}'
+
+def point_vector(text, body, title=None):
+    # with title vectors the dense vectors are named "body" and "title", otherwise the body vector is the unnamed default
+    # the sparse vector is added under its own name, and is computed from the text even when the body isn't embedded yet
+    if not title_vectors and not sparse_vectors:
+        return body
+    vector = {}
+    if body is not None:
+        vector["body" if title_vectors else ""] = body
+    if title is not None:
+        vector["title"] = title
+    if sparse_vectors:
+        vector[SPARSE_VECTOR_NAME] = document_vector(text, sparse_avg_doc_length)
+    return vector
+
+def embed_points(batch, embedding_model, headlines_only=False):
+    # one embed() call for every passage of the batch of (id, payload) articles, returned as (id, payload, points) per article
+    # headlines_only embeds just the cheap title vectors, so new articles are searchable before their bodies are embedded
+    passages = [article_passages(txt_id, payload) for txt_id, payload in batch]
+    texts = []
+    for article in passages:
+        for _, point_payload, text in article:
+            if not headlines_only:
+                texts.append(text)
+            if title_vectors:
+                texts.append(title_text(point_payload))
+    vectors = iter(embed_texts(texts, embedding_model))
+
+    articles = []
+    for (txt_id, payload), article in zip(batch, passages):
+        points = []
+        for point_id, point_payload, text in article:
+            body = None if headlines_only else next(vectors)
+            title = next(vectors) if title_vectors else None
+            points.append(models.PointStruct(id=point_id, payload={**point_payload, "body_indexed": False} if headlines_only else point_payload, vector=point_vector(text, body, title)))
+        articles.append((txt_id, payload, points))
+    return articles
+
+def stale_points(txt_id, points):
+    # an updated article's new points overwrite its old ones by ID, leaving only the passages past its new chunk_count,
+    # or all passages when it went back to a single whole-article point
+    if points[0].id == txt_id:
+        return models.FieldCondition(key="parent_id", match=models.MatchValue(value=txt_id))
+    return models.Filter(should=[
+        models.HasIdCondition(has_id=[txt_id]),
+        models.Filter(must=[
+            models.FieldCondition(key="parent_id", match=models.MatchValue(value=txt_id)),
+            models.FieldCondition(key="chunk_index", range=models.Range(gte=len(points))),
+        ]),
+    ])
+
+def upsert_points(articles, client, collection_name, indexed, manifest_file, checkpoint, wait=False):
+    client.upsert(collection_name=collection_name, points=[point for _, _, points in articles for point in points], wait=wait)
+    # stale points are deleted only after the new version is written, so updated articles never drop out of search
+    stale = [stale_points(txt_id, points) for txt_id, _, points in articles if txt_id in indexed]
+    if stale:
+        client.delete(collection_name=collection_name, points_selector=models.FilterSelector(filter=models.Filter(should=stale)), wait=wait)
+    # only record files in the manifest and checkpoint once Qdrant has accepted all of their points
+    append_manifest([{"id": txt_id, "mtime": payload["mtime"], "size": payload["size"], "content_hash": payload["content_hash"]} for txt_id, payload, _ in articles], manifest_file)
+    checkpoint.commit([[txt_id, payload["mtime"], payload["size"]] for txt_id, payload, _ in articles])
+
+def parse_stage(inbox, outbox, indexed, manifest, manifest_file, checkpoint, counts):
+    while (txt := inbox.get()) is not STOP:
+        txt_id = article_id(txt)
+        try:
+            stat = txt.stat()
+            if checkpoint.unchanged(txt_id, stat): # already upserted by the interrupted run being resumed, and not edited since
+                continue
+            entry = manifest.get(txt_id)
+            if txt_id in indexed and entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size and entry["content_hash"] == indexed[txt_id]: # unchanged since last run, skip without reading
+                counts.add("unchanged")
+                continue
+            lines = open(txt, 'r', encoding='utf-8').readlines()
+            txt_payload = parse(lines)
+        except (OSError, UnicodeDecodeError, IndexError) as e: # one unreadable or malformed file must not stop the others
+            print(f"Skipping {txt}: {e!r}")
+            counts.add("failed")
+            continue
+
+        content_hash = hashlib.sha256(''.join(lines).encode('utf-8')).hexdigest()
+        if indexed.get(txt_id) == content_hash: # touched but not modified, refresh the manifest entry only
+            append_manifest([{"id": txt_id, "mtime": stat.st_mtime, "size": stat.st_size, "content_hash": content_hash}], manifest_file)
+            counts.add("unchanged")
+            continue
+        if txt_id in indexed:
+            counts.add("updated")
+        else:
+            counts.add("added")
+
+        txt_payload.update({"content_hash": content_hash, "mtime": stat.st_mtime, "size": stat.st_size, "embedding_model": config["lmstudio_embedding"]}) # record which model produced the vectors
+        if near_duplicates is not None: # syndicated copies of a story share the cluster of the first copy indexed
+            txt_payload["cluster_id"] = near_duplicates.assign(txt_id, txt_payload["content"])
+        outbox.put((txt_id, txt_payload))
+
+def embed_stage(inbox, outbox, embedding_model, headlines_only):
+    batch = []
+    while (item := inbox.get()) is not STOP:
+        batch.append(item)
+        if len(batch) >= embedding_batch_size:
+            for article in embed_points(batch, embedding_model, headlines_only):
+                outbox.put(article)
+            batch = []
+    if batch:
+        for article in embed_points(batch, embedding_model, headlines_only):
+            outbox.put(article)
+
+def upsert_stage(inbox, client, collection_name, indexed, manifest_file, checkpoint):
+    batch = []
+    while (article := inbox.get()) is not STOP:
+        if sum(len(points) for _, _, points in batch) >= upsert_batch_size: # a full batch is held until more input arrives, so the last one is never empty
+            upsert_points(batch, client, collection_name, indexed, manifest_file, checkpoint)
+            batch = []
+        batch.append(article)
+    # final flush waits so every batch this worker sent with wait=False is applied before we exit
+    if batch:
+        upsert_points(batch, client, collection_name, indexed, manifest_file, checkpoint, wait=True)
+
+class Counts:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {"added": 0, "updated": 0, "unchanged": 0, "failed": 0}
+    def add(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+def start_stage(target, workers, inbox, errors, *args):
+    def run():
+        try:
+            target(inbox, *args)
+        except BaseException as e:
+            errors.append(e)
+            while inbox.get() is not STOP: # keep draining so upstream stages never block on a full queue
+                pass
+    threads = [threading.Thread(target=run, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def finish_stage(threads, inbox):
+    for _ in threads:
+        inbox.put(STOP)
+    for thread in threads:
+        thread.join()
+
+def index_articles(txts, client, embedding_model, collection_name, partition=None, headlines_only=False):
+    # parse -> embed -> upsert stages joined by bounded queues, so throughput tracks the slowest stage
+    indexed = existing_ids(client, collection_name, partition)
+    manifest = load_manifest(partition)
+    manifest_file = partition_path(manifest_path, partition)
+    checkpoint = Checkpoint(collection_name, partition)
+    if checkpoint.committed:
+        print(f"Resuming an interrupted run, {len(checkpoint.committed)} articles already committed")
+    counts = Counts()
+    errors = []
+    paths, parsed, embedded = queue.Queue(queue_size), queue.Queue(queue_size), queue.Queue(queue_size)
+
+    parsers = start_stage(parse_stage, parse_workers, paths, errors, parsed, indexed, manifest, manifest_file, checkpoint, counts)
+    embedders = start_stage(embed_stage, embed_workers, parsed, errors, embedded, embedding_model, headlines_only)
+    upserters = start_stage(upsert_stage, upsert_workers, embedded, errors, client, collection_name, indexed, manifest_file, checkpoint)
+
+    for txt in txts:
+        paths.put(txt)
+    finish_stage(parsers, paths)
+    finish_stage(embedders, parsed)
+    finish_stage(upserters, embedded)
+
+    if errors:
+        raise errors[0]
+    checkpoint.finish()
+    return counts.counts
+
+def delete_orphans(txts, client, collection_name, partition=None):
+    # delete every point whose article is no longer on disk, comparing ID sets rather than checking files one by one
+    on_disk = {article_id(txt) for txt in txts}
+    orphans = []
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=collection_name, limit=scroll_batch_size, offset=offset, with_payload=["parent_id"], with_vectors=False)
+        for point in points:
+            txt_id = point.payload.get("parent_id", str(point.id))
+            if (partition is None or in_partition(txt_id, partition)) and txt_id not in on_disk:
+                orphans.append(point.id)
+        if offset is None:
+            break
+    for i in range(0, len(orphans), upsert_batch_size):
+        client.delete(collection_name=collection_name, points_selector=models.PointIdsList(points=orphans[i:i + upsert_batch_size]), wait=i + upsert_batch_size >= len(orphans))
+    return len(orphans)
+
+def index_partition(partition, shards, collection_name, sync=False, headlines_only=False):
+    # entry point for one worker process, with its own Qdrant and LM Studio connections
+    client = QdrantClient(url=config["qdrant_client_url"])
+    embedding_model = lms.embedding_model(config["lmstudio_embedding"])
+    check_embedding_dimension(client, collection_name, embedding_model, config["lmstudio_embedding"])
+    roots = [folder / shard for shard in shards] or [folder]
+    counts = index_articles(scan_articles(roots, partition), client, embedding_model, collection_name, partition, headlines_only)
+    counts["deleted"] = delete_orphans(scan_articles(roots, partition), client, collection_name, partition) if sync else 0
+    return counts
+
+def run_partitions(partitions, shards, collection_name, sync=False, headlines_only=False):
+    # one spawned process per partition, or the current process when there is only one
+    if len(partitions) == 1:
+        results = [index_partition(partitions[0], shards, collection_name, sync, headlines_only)]
+    else:
+        with ProcessPoolExecutor(len(partitions), mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = list(executor.map(index_partition, partitions, [shards] * len(partitions), [collection_name] * len(partitions), [sync] * len(partitions), [headlines_only] * len(partitions)))
+    return {key: sum(result[key] for result in results) for key in ("added", "updated", "unchanged", "failed", "deleted")}
+
+def parse_partition(parser, value, workers):
+    # partition i/N is split into the workers residues of the (N * workers)-way split that are congruent to i mod N,
+    # so hosts cover every ID exactly once even when they run different --workers
+    index, count = map(int, value.split("/"))
+    if not 0 <= index < count:
+        parser.error("--partition must be i/N with 0 <= i < N")
+    return [(index + count * worker, count * workers) for worker in range(workers)]
 
-    txt_id = str(uuid.UUID(hashlib.md5(txt.name.encode('utf-8')).hexdigest())) # use article name for deterministic UUID
-    if(len(client.retrieve(collection_name=config["qdrant_collection_name"], ids=[txt_id], with_payload=False, with_vectors=False)) > 0): # check if UUID exists already
-        continue
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index articles into Qdrant")
+    parser.add_argument("--shard", action="append", default=[], help="only scan this subdirectory of articles_path (repeatable)")
+    parser.add_argument("--workers", type=int, default=1, help="local processes, each indexing its own slice of this partition")
+    parser.add_argument("--partition", default="0/1", help="i/N: index only the i-th of N point-ID hash partitions, e.g. one per host")
+    parser.add_argument("--sync", action="store_true", help="also delete points whose article file no longer exists")
+    parser.add_argument("--headlines-only", action="store_true", help="embed only title vectors so new articles are searchable quickly, a later normal run adds the body vectors")
+    parser.add_argument("--bulk-load", action="store_true", help="disable HNSW indexing during ingest and rebuild it once at the end (use on one host only)")
+    args = parser.parse_args()
+    if args.sync and args.shard:
+        parser.error("--sync needs the whole tree, it cannot be combined with --shard")
+    if args.headlines_only and not title_vectors:
+        parser.error("--headlines-only needs title_vectors enabled in config.json")
+    partitions = parse_partition(parser, args.partition, args.workers)
 
-    txt_payload = parse(txt)
+    if args.bulk_load:
+        client = QdrantClient(url=config["qdrant_client_url"])
+        begin_bulk_load(client, config["qdrant_collection_name"])
 
-    txt_vector = embedding_model.embed(f'{txt_payload["title"]}\n\n{txt_payload["subtitle"]}\n\n{txt_payload["content"]}')
+    try:
+        counts = run_partitions(partitions, args.shard, config["qdrant_collection_name"], args.sync, args.headlines_only)
+    finally: # re-enable indexing even if the run fails or is interrupted, the collection is live
+        if args.bulk_load:
+            print("Waiting for the HNSW index to build")
+            end_bulk_load(client, config["qdrant_collection_name"])
 
-    client.upsert(
-        collection_name=config["qdrant_collection_name"],
-        points=[
-            models.PointStruct(
-                id = txt_id,
-                payload = txt_payload,
-                vector = txt_vector
-            )
-        ]
-    )
\ No newline at end of file
+    print(f"Added {counts['added']}, updated {counts['updated']}, unchanged {counts['unchanged']}, deleted {counts['deleted']}, failed {counts['failed']}")
@@ -0,0 +1,73 @@
+from qdrant_client import QdrantClient, models
+import lmstudio as lms
+import json
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from setup_qdrant import create_collection, create_payload_indexes, begin_bulk_load, end_bulk_load, versioned_collection_name, aliased_collection, swap_alias
+from index_articles import embed_texts, point_vector, title_text, title_vectors, embedding_batch_size, upsert_batch_size, embed_workers
+
+config = json.load(open("config.json", 'r'))
+
+def migrate(client, embedding_model, source, target, page_size):
+    # scroll the source page by page and re-embed its stored payloads with lmstudio_embedding, no article files needed
+    # the next scroll offset is saved after every page, so an interrupted migration continues where it stopped
+    checkpoint = Path(f"migration.{source}.{target}.json")
+    offset, migrated = None, 0
+    if checkpoint.exists():
+        state = json.load(open(checkpoint, 'r'))
+        offset, migrated = state["offset"], state["migrated"]
+        print(f"Resuming after {migrated} points")
+    total = client.count(collection_name=source, exact=True).count
+
+    with ThreadPoolExecutor(embed_workers) as executor:
+        while True:
+            points, next_offset = client.scroll(collection_name=source, limit=page_size, offset=offset, with_payload=True, with_vectors=False)
+            texts = [f'{point.payload["title"]}\n\n{point.payload["subtitle"]}\n\n{point.payload["content"]}' for point in points]
+            to_embed = texts + [title_text(point.payload) for point in points] if title_vectors else texts
+            batches = executor.map(lambda batch: embed_texts(batch, embedding_model), [to_embed[i:i + embedding_batch_size] for i in range(0, len(to_embed), embedding_batch_size)])
+            vectors = [vector for batch in batches for vector in batch]
+            titles = vectors[len(texts):] if title_vectors else [None] * len(texts)
+
+            migrated_points = [models.PointStruct(id=point.id, payload={**point.payload, "embedding_model": config["lmstudio_embedding"], "body_indexed": True}, vector=point_vector(text, vector, title)) for point, text, vector, title in zip(points, texts, vectors, titles)]
+            for i in range(0, len(migrated_points), upsert_batch_size):
+                client.upsert(collection_name=target, points=migrated_points[i:i + upsert_batch_size], wait=next_offset is None and i + upsert_batch_size >= len(migrated_points))
+
+            offset, migrated = next_offset, migrated + len(points)
+            print(f"Migrated {migrated}/{total} points")
+            if offset is None:
+                break
+            json.dump({"offset": offset, "migrated": migrated}, open(checkpoint, 'w'))
+
+    checkpoint.unlink(missing_ok=True)
+    return migrated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-embed every point of an existing collection with lmstudio_embedding into another collection")
+    parser.add_argument("--source", help="collection to read payloads from (default: the one behind qdrant_collection_name)")
+    parser.add_argument("--target", help="collection to write to, created if missing (default: a new versioned collection)")
+    parser.add_argument("--page-size", type=int, default=1024, help="points per scroll page")
+    parser.add_argument("--swap", action="store_true", help="point the qdrant_collection_name alias at the target when done")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=config["qdrant_client_url"])
+    embedding_model = lms.embedding_model(config["lmstudio_embedding"])
+    alias = config["qdrant_collection_name"]
+    source = args.source or aliased_collection(client, alias) or alias
+    target = args.target or versioned_collection_name(alias)
+
+    if not any(c.name == target for c in client.get_collections().collections):
+        create_collection(client, target, embedding_model)
+        create_payload_indexes(client, target)
+        begin_bulk_load(client, target)
+        print(f"Created collection {target}")
+
+    try:
+        migrated = migrate(client, embedding_model, source, target, args.page_size)
+    finally: # re-enable indexing even if the migration fails or is interrupted
+        print("Waiting for the HNSW index to build")
+        end_bulk_load(client, target)
+    print(f"Migrated {migrated} points from {source} to {target}")
+    if args.swap:
+        swap_alias(client, alias, target)
+        print(f"Alias {alias} now points to {target}, previous collection {source} kept")
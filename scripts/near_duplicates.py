@@ -0,0 +1,89 @@
+import sqlite3
+import threading
+import hashlib
+import random
+import re
+import numpy as np
+
+MERSENNE_PRIME = (1 << 61) - 1
+LOW_32 = np.uint64((1 << 32) - 1)
+LOW_29 = np.uint64((1 << 29) - 1)
+
+def shingles(text, size=5):
+    # hashed word n-grams of the normalized text
+    words = re.findall(r'\w+', text.lower())
+    grams = {' '.join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+    return [int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest(), 'little') for gram in grams]
+
+def mod_mersenne(x):
+    # x mod 2**61 - 1 for uint64 values below 2**63, using 2**61 = 1
+    p = np.uint64(MERSENNE_PRIME)
+    x = (x & p) + (x >> np.uint64(61))
+    return np.where(x >= p, x - p, x)
+
+def mul_mod_mersenne(x, y):
+    # exact x * y mod 2**61 - 1 for uint64 values below 2**61, from 32-bit halves so no product overflows 64 bits
+    x1, x0 = x >> np.uint64(32), x & LOW_32
+    y1, y0 = y >> np.uint64(32), y & LOW_32
+    high = (x1 * y1) << np.uint64(3) # 2**64 = 8
+    middle = x1 * y0 + x0 * y1
+    middle = (middle >> np.uint64(29)) + ((middle & LOW_29) << np.uint64(32)) # 2**61 = 1
+    low = x0 * y0
+    low = (low & np.uint64(MERSENNE_PRIME)) + (low >> np.uint64(61))
+    return mod_mersenne(high + middle + low)
+
+class NearDuplicateIndex:
+    # MinHash signatures with a banded LSH index on disk, assigning each article the cluster of its closest near-duplicate
+    def __init__(self, path, bands=16, rows=4, threshold=0.8):
+        self.bands = bands
+        self.rows = rows
+        self.threshold = threshold
+        rng = random.Random(0) # fixed permutations so signatures stay comparable across runs and processes
+        permutations = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME)) for _ in range(bands * rows)]
+        self.a = np.array([a for a, _ in permutations], dtype=np.uint64)[:, None]
+        self.b = np.array([b for _, b in permutations], dtype=np.uint64)[:, None]
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS signatures (id TEXT PRIMARY KEY, cluster_id TEXT, signature BLOB)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS buckets (band INTEGER, bucket TEXT, id TEXT, PRIMARY KEY (band, bucket, id))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS buckets_id ON buckets (id)")
+
+    def signature(self, text):
+        # (a * h + b) mod p for every permutation and shingle at once, numpy releases the GIL so parse threads overlap
+        hashes = mod_mersenne(np.array(shingles(text), dtype=np.uint64))[None, :]
+        return mod_mersenne(mul_mod_mersenne(self.a, hashes) + self.b).min(axis=1)
+
+    def buckets(self, signature):
+        return [(band, hashlib.md5(signature[band * self.rows:(band + 1) * self.rows].tobytes()).hexdigest()) for band in range(self.bands)]
+
+    def assign(self, txt_id, text):
+        signature = self.signature(text)
+        buckets = self.buckets(signature)
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE") # one writer at a time across processes, so two copies can't both found a cluster
+            try:
+                cluster_id = self.match(txt_id, signature, buckets)
+            except BaseException:
+                self.db.rollback()
+                raise
+            self.db.commit()
+        return cluster_id
+
+    def match(self, txt_id, signature, buckets):
+        candidates = set()
+        for band, bucket in buckets:
+            candidates.update(row[0] for row in self.db.execute("SELECT id FROM buckets WHERE band = ? AND bucket = ?", [band, bucket]))
+        candidates.discard(txt_id)
+
+        cluster_id, best = txt_id, self.threshold
+        for candidate in candidates:
+            candidate_cluster, blob = self.db.execute("SELECT cluster_id, signature FROM signatures WHERE id = ?", [candidate]).fetchone()
+            similarity = np.count_nonzero(signature == np.frombuffer(blob, dtype=np.uint64)) / len(signature) # estimated Jaccard similarity
+            if similarity >= best:
+                cluster_id, best = candidate_cluster, similarity
+
+        self.db.execute("INSERT OR REPLACE INTO signatures VALUES (?, ?, ?)", [txt_id, cluster_id, signature.tobytes()])
+        self.db.execute("DELETE FROM buckets WHERE id = ?", [txt_id]) # an updated article must not stay findable under its old bands
+        self.db.executemany("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)", [(band, bucket, txt_id) for band, bucket in buckets])
+        return cluster_id
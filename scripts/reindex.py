@@ -0,0 +1,53 @@
+from qdrant_client import QdrantClient
+import lmstudio as lms
+import json
+import argparse
+from setup_qdrant import create_collection, create_payload_indexes, begin_bulk_load, end_bulk_load, versioned_collection_name, aliased_collection, swap_alias
+from index_articles import run_partitions, parse_partition, existing_ids, scan_articles, folder
+
+config = json.load(open("config.json", 'r'))
+
+def reindex(client, embedding_model, alias, partitions):
+    # build a fresh versioned collection while agent.py keeps querying the current one, then repoint the alias at it
+    target = versioned_collection_name(alias)
+    create_collection(client, target, embedding_model)
+    create_payload_indexes(client, target)
+    begin_bulk_load(client, target)
+    print(f"Indexing into {target}")
+
+    try:
+        counts = run_partitions(partitions, [], target)
+    finally: # a failed run still leaves an indexed collection to inspect or roll back to
+        print("Waiting for the HNSW index to build")
+        end_bulk_load(client, target)
+
+    # only swap once every readable article on disk is in the new collection
+    on_disk = sum(1 for _ in scan_articles([folder])) - counts["failed"]
+    indexed = len(existing_ids(client, target))
+    if indexed != on_disk:
+        raise SystemExit(f"{target} holds {indexed} articles but {on_disk} readable ones are on disk, alias {alias} left unchanged")
+    if counts["failed"]:
+        print(f"{counts['failed']} articles could not be read or parsed and are not in {target}")
+
+    swap_alias(client, alias, target)
+    print(f"Alias {alias} now points to {target} ({indexed} articles)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the collection behind the qdrant_collection_name alias without downtime")
+    parser.add_argument("--workers", type=int, default=1, help="local indexing processes")
+    parser.add_argument("--rollback", metavar="COLLECTION", help="point the alias back at COLLECTION instead of reindexing")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=config["qdrant_client_url"])
+    alias = config["qdrant_collection_name"]
+    current = aliased_collection(client, alias)
+    if current is None and any(c.name == alias for c in client.get_collections().collections):
+        parser.error(f'"{alias}" is a collection, not an alias. Set qdrant_collection_name to a new name so it can be created as an alias')
+
+    if args.rollback:
+        swap_alias(client, alias, args.rollback)
+        print(f"Alias {alias} now points to {args.rollback}")
+    else:
+        reindex(client, lms.embedding_model(config["lmstudio_embedding"]), alias, parse_partition(parser, "0/1", args.workers))
+        if current is not None:
+            print(f"Previous collection {current} kept, roll back with: python scripts/reindex.py --rollback {current}")
@@ -1,15 +1,108 @@
 from qdrant_client import QdrantClient, models
+import lmstudio as lms
 import json
+import time
+from datetime import datetime
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent)) # sparse_vectors.py and embedding_dimension.py are shared with agent.py
+from sparse_vectors import SPARSE_VECTOR_NAME
+from embedding_dimension import embedding_dimension, check_embedding_dimension
 
 config = json.load(open("config.json", 'r'))
 
-client = QdrantClient(url=config["qdrant_client_url"])
+def quantization_config():
+    # scalar int8 keeps 1/4 of float32 vectors in RAM, binary 1/32, with originals on disk for rescoring
+    quantization = config.get("quantization")
+    always_ram = config.get("quantization_always_ram", True)
+    if quantization == "scalar":
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=always_ram))
+    if quantization == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=always_ram))
+    if quantization is not None:
+        raise ValueError(f'Unknown quantization "{quantization}", expected "scalar", "binary" or null')
+    return None
 
-collections_list = client.get_collections()
+def hnsw_config():
+    # higher m and ef_construct raise recall at the cost of memory and build time
+    return models.HnswConfigDiff(m=config.get("hnsw_m", 16), ef_construct=config.get("hnsw_ef_construct", 100))
 
-if not any(c.name == config["qdrant_collection_name"] for c in collections_list.collections):
-    client.create_collection(collection_name=config["qdrant_collection_name"], vectors_config=models.VectorParams(size=1024, distance=models.Distance.COSINE))
-    print("Created collection")
-else:
-    print("Collection name already in use")
+def optimizers_config():
+    # unset values keep Qdrant's defaults, an indexing_threshold of 0 disables HNSW indexing
+    return models.OptimizersConfigDiff(
+        default_segment_number=config.get("optimizer_default_segment_number"),
+        max_segment_size=config.get("optimizer_max_segment_size"),
+        indexing_threshold=config.get("optimizer_indexing_threshold"),
+    )
 
+def create_collection(client, collection_name, embedding_model):
+    vector_params = models.VectorParams(size=embedding_dimension(embedding_model), distance=models.Distance.COSINE, on_disk=config.get("vectors_on_disk", False))
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={"body": vector_params, "title": vector_params} if config.get("title_vectors", False) else vector_params,
+        sparse_vectors_config={SPARSE_VECTOR_NAME: models.SparseVectorParams(modifier=models.Modifier.IDF)} if config.get("sparse_vectors", False) else None,
+        quantization_config=quantization_config(),
+        hnsw_config=hnsw_config(),
+        optimizers_config=optimizers_config(),
+        on_disk_payload=config.get("payload_on_disk", False),
+    )
+
+def begin_bulk_load(client, collection_name):
+    # stop building the HNSW graph while points stream in, it is built once by end_bulk_load
+    client.update_collection(collection_name=collection_name, optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0))
+
+def end_bulk_load(client, collection_name):
+    client.update_collection(collection_name=collection_name, optimizers_config=models.OptimizersConfigDiff(indexing_threshold=config.get("optimizer_indexing_threshold") or 20000)) # Qdrant's default threshold, in KB
+    while (status := client.get_collection(collection_name).status) != models.CollectionStatus.GREEN:
+        if status == models.CollectionStatus.RED: # optimization failed, it won't turn green without intervention
+            raise RuntimeError(f'Collection "{collection_name}" is RED while building its HNSW index, check the Qdrant logs')
+        time.sleep(5)
+
+def versioned_collection_name(alias):
+    return f"{alias}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+def aliased_collection(client, alias):
+    for description in client.get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+def swap_alias(client, alias, collection_name):
+    # a single alias update is atomic, so queries see either the old collection or the new one, never neither
+    operations = []
+    if aliased_collection(client, alias) is not None:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    operations.append(models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=operations)
+
+def create_payload_indexes(client, collection_name):
+    # payload indexes let retrieval filter by publication window and author server-side
+    client.create_payload_index(collection_name=collection_name, field_name="published", field_schema=models.PayloadSchemaType.DATETIME)
+    client.create_payload_index(collection_name=collection_name, field_name="authors", field_schema=models.PayloadSchemaType.KEYWORD)
+    client.create_payload_index(collection_name=collection_name, field_name="parent_id", field_schema=models.PayloadSchemaType.KEYWORD)
+    client.create_payload_index(collection_name=collection_name, field_name="embedding_model", field_schema=models.PayloadSchemaType.KEYWORD)
+    client.create_payload_index(collection_name=collection_name, field_name="events_model", field_schema=models.PayloadSchemaType.KEYWORD)
+
+if __name__ == "__main__":
+    client = QdrantClient(url=config["qdrant_client_url"])
+    embedding_model = lms.embedding_model(config["lmstudio_embedding"])
+
+    # qdrant_collection_name is created as an alias of a versioned collection, so scripts/reindex.py can swap it later
+    collections_list = client.get_collections()
+    collection_name = aliased_collection(client, config["qdrant_collection_name"])
+
+    if collection_name is not None:
+        print(f"Collection name already in use (alias of {collection_name})")
+        check_embedding_dimension(client, collection_name, embedding_model, config["lmstudio_embedding"])
+    elif any(c.name == config["qdrant_collection_name"] for c in collections_list.collections):
+        collection_name = config["qdrant_collection_name"]
+        print("Collection name already in use")
+        check_embedding_dimension(client, collection_name, embedding_model, config["lmstudio_embedding"])
+    else:
+        collection_name = versioned_collection_name(config["qdrant_collection_name"])
+        create_collection(client, collection_name, embedding_model)
+        swap_alias(client, config["qdrant_collection_name"], collection_name)
+        print(f"Created collection {collection_name} with alias {config['qdrant_collection_name']}")
+
+    create_payload_indexes(client, collection_name)
+    print("Created payload indexes")
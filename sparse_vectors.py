@@ -0,0 +1,28 @@
+from qdrant_client import models
+from collections import Counter
+import re
+import zlib
+
+# BM25-style lexical vectors computed locally, shared by scripts/index_articles.py and agent.py so terms hash identically.
+# Documents carry the BM25 term-frequency part, Qdrant applies IDF at query time (Modifier.IDF on the sparse vector).
+
+SPARSE_VECTOR_NAME = "text"
+
+def terms(text):
+    return re.findall(r'\w+', text.lower())
+
+def term_index(term):
+    return zlib.crc32(term.encode('utf-8'))
+
+def document_vector(text, avg_doc_length=300, k1=1.2, b=0.75):
+    counts = Counter(terms(text))
+    length = sum(counts.values())
+    weights = Counter()
+    for term, tf in counts.items():
+        weights[term_index(term)] += tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_doc_length))
+    indices = sorted(weights)
+    return models.SparseVector(indices=indices, values=[weights[i] for i in indices])
+
+def query_vector(text):
+    indices = sorted({term_index(term) for term in terms(text)})
+    return models.SparseVector(indices=indices, values=[1.0] * len(indices))